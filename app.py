@@ -7,11 +7,16 @@ import pandas as pd
 from pathlib import Path
 import os
 import tempfile
+import threading
+from collections import deque
+import httpx
+from itertools import islice
+from cachetools import TTLCache
 
 # Import utilities
-from utils.db import DatabaseManager
+from utils.db import DatabaseManager, canonical_sql, data_signature
 from utils.llm import LLMManager
-from utils.voice import VoiceManager
+from utils.stats import numeric_summary
 from utils.ui import (
     display_query_results, 
     display_schema_info, 
@@ -26,153 +31,30 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS - EnlitenAI Branding
-st.markdown("""
-<style>
-    /* EnlitenAI Color Palette */
-    :root {
-        --primary-color: #0066cc;
-        --secondary-color: #00a3e0;
-        --accent-color: #4CAF50;
-        --text-dark: #1a1a1a;
-        --text-light: #666666;
-        --bg-light: #f8f9fa;
-    }
-    
-    /* Main Header */
-    .main-header {
-        font-size: 2.8rem;
-        font-weight: 700;
-        color: var(--primary-color);
-        text-align: center;
-        margin-bottom: 0.5rem;
-        font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-    }
-    
-    .subtitle {
-        text-align: center;
-        color: var(--text-light);
-        font-size: 1.1rem;
-        margin-bottom: 2rem;
-        font-style: italic;
-    }
-    
-    /* Buttons */
-    .stButton>button {
-        width: 100%;
-        background-color: var(--primary-color);
-        color: white;
-        border: none;
-        padding: 0.75rem 1.5rem;
-        border-radius: 8px;
-        font-weight: 600;
-        transition: all 0.3s ease;
-    }
-    
-    .stButton>button:hover {
-        background-color: var(--secondary-color);
-        box-shadow: 0 4px 12px rgba(0, 102, 204, 0.3);
-        transform: translateY(-2px);
-    }
-    
-    /* Success Box */
-    .success-box {
-        padding: 1.5rem;
-        border-radius: 10px;
-        background: linear-gradient(135deg, #d4edda 0%, #c3e6cb 100%);
-        border-left: 5px solid var(--accent-color);
-        color: #155724;
-        box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);
-    }
-    
-    /* Error Box */
-    .error-box {
-        padding: 1.5rem;
-        border-radius: 10px;
-        background: linear-gradient(135deg, #f8d7da 0%, #f5c6cb 100%);
-        border-left: 5px solid #dc3545;
-        color: #721c24;
-        box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);
-    }
-    
-    /* Info Box */
-    .info-box {
-        padding: 1.5rem;
-        border-radius: 10px;
-        background: linear-gradient(135deg, #d1ecf1 0%, #bee5eb 100%);
-        border-left: 5px solid var(--secondary-color);
-        color: #0c5460;
-        box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);
-    }
-    
-    /* Cards */
-    .metric-card {
-        background: white;
-        padding: 1.5rem;
-        border-radius: 12px;
-        box-shadow: 0 2px 12px rgba(0, 0, 0, 0.08);
-        border-left: 4px solid var(--primary-color);
-        margin-bottom: 1rem;
-    }
-    
-    /* Sidebar */
-    .css-1d391kg {
-        background-color: var(--bg-light);
-    }
-    
-    /* Text Input */
-    .stTextInput>div>div>input {
-        border-radius: 8px;
-        border: 2px solid #e0e0e0;
-        padding: 0.75rem;
-        transition: border-color 0.3s ease;
-    }
-    
-    .stTextInput>div>div>input:focus {
-        border-color: var(--primary-color);
-        box-shadow: 0 0 0 2px rgba(0, 102, 204, 0.1);
-    }
-    
-    /* Tables */
-    .dataframe {
-        border-radius: 8px;
-        overflow: hidden;
-        box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);
-    }
-    
-    /* SQL Code Block */
-    .sql-block {
-        background-color: #2d2d2d;
-        color: #f8f8f2;
-        padding: 1.5rem;
-        border-radius: 8px;
-        font-family: 'Courier New', monospace;
-        overflow-x: auto;
-        box-shadow: 0 2px 8px rgba(0, 0, 0, 0.15);
-    }
-    
-    /* Footer */
-    .footer {
-        text-align: center;
-        padding: 2rem 0;
-        color: var(--text-light);
-        font-size: 0.9rem;
-        border-top: 1px solid #e0e0e0;
-        margin-top: 3rem;
-    }
-    
-    /* EnlitenAI Logo Text */
-    .enliten-logo {
-        font-size: 2.5rem;
-        font-weight: 700;
-        background: linear-gradient(135deg, var(--primary-color) 0%, var(--secondary-color) 100%);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        text-align: center;
-        margin-bottom: 0.5rem;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Static assets (CSS and branding HTML) live in assets/
+ASSETS_DIR = Path("assets")
+
+
+@st.cache_data(show_spinner=False)
+def _read_asset(name: str, mtime: float) -> str:
+    """Read a static asset; mtime is only part of the cache key"""
+    return (ASSETS_DIR / name).read_text(encoding="utf-8")
+
+
+def load_asset(name: str) -> str:
+    """Cached contents of a file in the assets folder"""
+    return _read_asset(name, (ASSETS_DIR / name).stat().st_mtime)
+
+
+# Query history limits: entries kept, entries per page, characters per text field
+HISTORY_MAX_ENTRIES = 100
+HISTORY_PAGE_SIZE = 20
+HISTORY_TEXT_LIMIT = 2000
+
+
+def _truncate(text: str, limit: int) -> str:
+    """Cut text to at most limit characters"""
+    return text if len(text) <= limit else text[:limit - 1] + "…"
 
 
 # Initialize session state
@@ -185,7 +67,9 @@ def init_session_state():
     if 'voice_manager' not in st.session_state:
         st.session_state.voice_manager = None
     if 'query_history' not in st.session_state:
-        st.session_state.query_history = []
+        st.session_state.query_history = deque(maxlen=HISTORY_MAX_ENTRIES)
+    if 'history_page' not in st.session_state:
+        st.session_state.history_page = 1
     if 'query_input' not in st.session_state:
         st.session_state.query_input = ""
     if 'current_page' not in st.session_state:
@@ -200,14 +84,41 @@ def init_session_state():
         st.session_state.api_keys_configured = False
 
 
-def initialize_managers():
-    """Initialize all managers"""
+@st.cache_resource(show_spinner="Loading database...", max_entries=1)
+def get_db_manager(data_folder: str, signature: tuple) -> DatabaseManager:
+    """
+    Build the shared database manager for all sessions
+    
+    signature (name, mtime, size of each CSV) is only part of the cache
+    key, so the CSVs are reloaded when any file in the data folder changes.
+    Only the latest manager is kept; a stale one and its in-memory copy of
+    the data are dropped instead of piling up with every change.
+    """
+    db_manager = DatabaseManager(data_folder)
+    db_manager.load_csvs_to_db()
+    return db_manager
+
+
+@st.cache_resource
+def get_http_client() -> httpx.Client:
+    """Keep-alive HTTP/2 connection pool shared by all OpenAI clients"""
+    return httpx.Client(http2=True, limits=httpx.Limits(max_keepalive_connections=8))
+
+
+def create_voice_manager(api_key: str):
+    """Create a VoiceManager, importing the voice module only on first use"""
+    from utils.voice import VoiceManager
+    return VoiceManager(api_key, http_client=get_http_client())
+
+
+def initialize_managers(voice_needed: bool = True):
+    """
+    Initialize all managers
+    The voice manager is only created when voice input or TTS will be used.
+    """
     try:
-        # Initialize database
-        if st.session_state.db_manager is None:
-            with st.spinner("Loading database..."):
-                st.session_state.db_manager = DatabaseManager("data")
-                st.session_state.db_manager.load_csvs_to_db()
+        # Initialize database (shared across sessions via st.cache_resource)
+        st.session_state.db_manager = get_db_manager("data", data_signature("data"))
         
         # Initialize LLM
         if st.session_state.llm_manager is None:
@@ -229,17 +140,21 @@ def initialize_managers():
                 st.stop()
             
             try:
-                st.session_state.llm_manager = LLMManager(provider, api_key)
+                llm_manager = LLMManager(provider, api_key, http_client=get_http_client())
+                st.session_state.llm_manager = llm_manager
                 st.session_state.api_keys_configured = True
+                
+                # Open the API connection in the background before the first query
+                threading.Thread(target=llm_manager.warm_up, daemon=True).start()
             except Exception as e:
                 st.error(f"⚠️ LLM initialization error: {str(e)}")
                 st.stop()
         
         # Initialize Voice (requires OpenAI)
-        if st.session_state.voice_manager is None:
+        if voice_needed and st.session_state.voice_manager is None:
             if st.session_state.openai_api_key:
                 try:
-                    st.session_state.voice_manager = VoiceManager(st.session_state.openai_api_key)
+                    st.session_state.voice_manager = create_voice_manager(st.session_state.openai_api_key)
                 except Exception as e:
                     st.warning(f"⚠️ Voice features unavailable: {str(e)}")
                     st.session_state.voice_manager = None
@@ -253,52 +168,169 @@ def initialize_managers():
         return False
 
 
+# Result sets up to this size get a template answer instead of an LLM summary
+TEMPLATE_ANSWER_MAX_ROWS = 10
+
+
+def _normalize_query(query: str) -> str:
+    """Collapse whitespace so trivially different questions share a cache entry"""
+    return " ".join(query.split())
+
+
+@st.cache_resource
+def _llm_response_cache() -> tuple[TTLCache, threading.Lock]:
+    """
+    LLM responses shared by all sessions (one-hour TTL)
+    
+    A plain cache rather than st.cache_data so that responses can be
+    streamed to the page on a miss and stored once complete.
+    """
+    return TTLCache(maxsize=256, ttl=3600), threading.Lock()
+
+
+def _cache_get(key: tuple):
+    """Look up a cached LLM response"""
+    cache, lock = _llm_response_cache()
+    with lock:
+        return cache.get(key)
+
+
+def _cache_set(key: tuple, value):
+    """Store an LLM response in the shared cache"""
+    cache, lock = _llm_response_cache()
+    with lock:
+        cache[key] = value
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _cached_execute(_db: DatabaseManager, signature: tuple, sql_key: str, _sql_query: str) -> pd.DataFrame:
+    """
+    Cached db.execute_query, invalidated when the CSV files change
+    Keyed on the canonical form of the query (sql_key), so reformatted
+    copies of a query reuse the result. The manager and the raw query are
+    underscored so Streamlit doesn't hash them.
+    """
+    return _db.execute_query(_sql_query)
+
+
+def _execute(db: DatabaseManager, sql_query: str) -> pd.DataFrame:
+    """Run a validated query through the result cache"""
+    return _cached_execute(db, db.data_signature, canonical_sql(sql_query), sql_query)
+
+
+def _results_preview(results: pd.DataFrame, max_rows: int = 50) -> str:
+    """Compact CSV preview of query results for the answer prompt"""
+    result_text = results.head(max_rows).to_csv(index=False)
+    if len(results) > max_rows:
+        result_text += f"# truncated, showing {max_rows} of {len(results)} rows\n"
+        # Statistics over all rows, so the answer isn't based on the preview alone
+        summary = numeric_summary(results)
+        if summary:
+            result_text += f"# summary of all {len(results)} rows:\n{summary}\n"
+    return result_text
+
+
+def _format_value(value) -> str:
+    """Format a single result value for a plain-text answer"""
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    return str(value)
+
+
+def _template_answer(results: pd.DataFrame) -> str:
+    """Plain-text answer for small result sets, built without an LLM call"""
+    if results.empty:
+        return "The query returned no results."
+    
+    rows = [
+        ", ".join(f"{col}: {_format_value(value)}" for col, value in row.items())
+        for row in results.to_dict(orient="records")
+    ]
+    if len(rows) == 1:
+        return f"Result: {rows[0]}."
+    return f"Found {len(rows)} rows: " + "; ".join(rows) + "."
+
+
 def process_text_query(query: str):
     """Process a text query"""
     try:
         db = st.session_state.db_manager
         llm = st.session_state.llm_manager
+        query = _normalize_query(query)
         
         # Get schema description
         schema_desc = db.get_schema_description()
         
-        # Generate SQL
-        with st.spinner("🤖 Generating SQL query..."):
-            sql_query, explanation = llm.text_to_sql(query, schema_desc)
+        st.subheader("🔍 Generated SQL Query")
+        
+        # Generate SQL, streaming it to the page unless the same or a
+        # paraphrased question was answered before
+        cached_sql = llm.cached_sql(query, schema_desc)
+        if cached_sql is not None:
+            sql_query, explanation = cached_sql
+        else:
+            placeholder = st.empty()
+            streamed = placeholder.write_stream(llm.text_to_sql_stream(query, schema_desc))
+            placeholder.empty()
+            sql_query, explanation = llm.parse_streamed_sql(streamed)
         
-        # Validate SQL
+        # Validate SQL; on failure, give the model one chance to fix its
+        # query using the error SQLite reported
         is_valid, error_msg = db.validate_sql(sql_query)
         if not is_valid:
-            st.error(f"❌ SQL validation failed: {error_msg}")
-            return
+            with st.spinner("🛠️ Fixing SQL query..."):
+                sql_query, explanation = llm.fix_sql(query, schema_desc, sql_query, error_msg)
+            is_valid, error_msg = db.validate_sql(sql_query)
+            if not is_valid:
+                st.error(f"❌ SQL validation failed: {error_msg}")
+                return
+        
+        # Only SQL that passed validation is reused for later questions
+        if (sql_query, explanation) != cached_sql:
+            llm.cache_sql(query, schema_desc, sql_query, explanation)
         
         # Display generated SQL
-        st.subheader("🔍 Generated SQL Query")
         st.code(format_sql_query(sql_query), language="sql")
         st.info(f"**Explanation:** {explanation}")
         
         # Execute query
         with st.spinner("⚙️ Executing query..."):
-            results = db.execute_query(sql_query)
+            results = _execute(db, sql_query)
         
         # Display results
         st.subheader("📊 Query Results")
         display_query_results(results)
         
-        # Generate natural language answer
-        with st.spinner("💬 Generating answer..."):
-            result_text = results.to_string() if not results.empty else "No results found"
-            answer = llm.generate_answer(query, result_text)
-        
+        # Generate natural language answer; small results are summarized
+        # directly instead of paying for a second LLM round trip
         st.subheader("💡 Answer Summary")
-        st.success(answer)
+        if len(results) <= TEMPLATE_ANSWER_MAX_ROWS:
+            answer = _template_answer(results)
+            st.success(answer)
+        else:
+            result_text = _results_preview(results)
+            answer_key = ("answer", llm.provider, query, result_text)
+            answer = _cache_get(answer_key)
+            if answer is not None:
+                st.success(answer)
+            else:
+                placeholder = st.empty()
+                try:
+                    answer = placeholder.write_stream(llm.stream_answer(query, result_text))
+                except Exception:
+                    # Not cached, so the next ask tries the provider again
+                    answer = "Unable to generate answer summary."
+                    placeholder.warning(answer)
+                else:
+                    placeholder.success(answer)
+                    _cache_set(answer_key, answer)
         
         # Add to history
         st.session_state.query_history.append({
-            "query": query,
+            "query": _truncate(query, HISTORY_TEXT_LIMIT),
             "sql": sql_query,
             "results": len(results),
-            "answer": answer
+            "answer": _truncate(answer, HISTORY_TEXT_LIMIT)
         })
         
         return answer
@@ -312,10 +344,11 @@ def main():
     """Main application"""
     init_session_state()
     
+    # Custom CSS - EnlitenAI Branding
+    st.markdown(f"<style>\n{load_asset('style.css')}</style>", unsafe_allow_html=True)
+    
     # EnlitenAI Header
-    st.markdown('<div class="enliten-logo">EnlitenAI</div>', unsafe_allow_html=True)
-    st.markdown('<div class="subtitle">Decision Support Software for Neurological Care</div>', unsafe_allow_html=True)
-    st.markdown('<div style="text-align: center; color: #666; margin-bottom: 2rem;">Transforming passive monitoring into proactive, personalized intervention</div>', unsafe_allow_html=True)
+    st.markdown(load_asset("header.html"), unsafe_allow_html=True)
     
     # Sidebar
     with st.sidebar:
@@ -427,9 +460,9 @@ def main():
         # Mode selection
         st.subheader("Query Mode")
         
-        # Check if voice is available
+        # Voice input is available whenever an OpenAI key is configured
         available_modes = ["Text Input", "Direct SQL"]
-        if st.session_state.voice_manager is not None:
+        if st.session_state.openai_api_key:
             available_modes.insert(1, "Voice Input")
         
         query_mode = st.radio(
@@ -443,17 +476,20 @@ def main():
         # Settings
         st.subheader("⚙️ Settings")
         tts_enabled = st.checkbox("Enable Text-to-Speech", value=True)
-        tts_voice = st.selectbox(
-            "TTS Voice",
-            ["alloy", "echo", "fable", "onyx", "nova", "shimmer"],
-            index=0
-        )
+        tts_voice = "alloy"
+        if tts_enabled:
+            tts_voice = st.selectbox(
+                "TTS Voice",
+                ["alloy", "echo", "fable", "onyx", "nova", "shimmer"],
+                index=0
+            )
         
         st.divider()
         st.caption("💡 Tip: Use natural language to query patient data!")
     
     # Initialize managers after API configuration
-    if not initialize_managers():
+    voice_needed = page == "Query Interface" and (query_mode == "Voice Input" or tts_enabled)
+    if not initialize_managers(voice_needed):
         return
     
     # Main content
@@ -480,6 +516,9 @@ def show_query_interface(query_mode: str, tts_enabled: bool, tts_voice: str):
     </div>
     """, unsafe_allow_html=True)
     
+    # Set by the example query buttons; only used by Text Input mode
+    auto_submit = st.session_state.pop("auto_submit", False)
+    
     # Main layout with two columns
     main_col, example_col = st.columns([2, 1])
     
@@ -489,21 +528,22 @@ def show_query_interface(query_mode: str, tts_enabled: bool, tts_voice: str):
         st.markdown('<p style="color: #666; font-size: 0.9rem; margin-bottom: 0.5rem;">Ask about patients, medications, seizures, or assessments</p>', unsafe_allow_html=True)
         
         if query_mode == "Text Input":
-            query = st.text_area(
-                "Type your question in natural language:",
-                value=st.session_state.query_input,
-                height=120,
-                placeholder="e.g., What is the average QoL score for patient P001?",
-                label_visibility="collapsed"
-            )
+            # A form only reruns the script on submit, not on every edit
+            with st.form("query_form", clear_on_submit=False, border=False):
+                query = st.text_area(
+                    "Type your question in natural language:",
+                    value=st.session_state.query_input,
+                    height=120,
+                    placeholder="e.g., What is the average QoL score for patient P001?",
+                    label_visibility="collapsed"
+                )
+                submit_button = st.form_submit_button("🔍 Search", type="primary", use_container_width=True)
             
-            # Action buttons
-            col1, col2, col3 = st.columns([2, 1, 1])
+            # Navigation buttons (outside the form)
+            col1, col2 = st.columns(2)
             with col1:
-                submit_button = st.button("🔍 Search", type="primary", use_container_width=True)
-            with col2:
                 clear_button = st.button("🗑️ Clear", use_container_width=True)
-            with col3:
+            with col2:
                 if st.button("📊 Schema", use_container_width=True):
                     st.session_state.current_page = "Database Schema"
                     st.rerun()
@@ -512,6 +552,11 @@ def show_query_interface(query_mode: str, tts_enabled: bool, tts_voice: str):
                 st.session_state.query_input = ""
                 st.rerun()
             
+            # Clicking an example query submits it right away
+            if auto_submit:
+                submit_button = True
+                query = st.session_state.query_input
+            
             if submit_button and query:
                 answer = process_text_query(query)
                 
@@ -590,7 +635,7 @@ def show_query_interface(query_mode: str, tts_enabled: bool, tts_voice: str):
                         
                         # Execute
                         with st.spinner("⚙️ Executing..."):
-                            results = db.execute_query(sql_query)
+                            results = _execute(db, sql_query)
                         
                         st.subheader("📊 Results")
                         display_query_results(results)
@@ -609,20 +654,12 @@ def show_schema_page():
     st.markdown('<p style="text-align: center; color: #666; margin-bottom: 2rem;">View data structure and available tables</p>', unsafe_allow_html=True)
     
     if st.session_state.db_manager:
-        schema_info = st.session_state.db_manager.get_schema_info()
-        display_schema_info(schema_info)
+        db = st.session_state.db_manager
+        display_schema_info(db.get_schema_info(), db.schema_columns)
         
-        # Show table statistics
+        # Show table statistics (precomputed when the CSVs were loaded)
         st.subheader("📈 Database Statistics")
-        stats = []
-        for table_name, info in schema_info.items():
-            stats.append({
-                "Table": table_name,
-                "Rows": info['row_count'],
-                "Columns": len(info['columns'])
-            })
-        
-        st.dataframe(pd.DataFrame(stats), use_container_width=True, hide_index=True)
+        st.dataframe(st.session_state.db_manager.stats_df, use_container_width=True, hide_index=True)
     else:
         st.error("Database not initialized")
 
@@ -636,17 +673,26 @@ def show_history_page():
         st.info("No queries executed yet.")
         return
     
-    # Display history in reverse order (most recent first)
-    for i, item in enumerate(reversed(st.session_state.query_history)):
-        with st.expander(f"Query {len(st.session_state.query_history) - i}: {item['query'][:50]}..."):
+    history = st.session_state.query_history
+    visible = HISTORY_PAGE_SIZE * st.session_state.history_page
+    
+    # Display history in reverse order (most recent first), one page at a time
+    for i, item in enumerate(islice(reversed(history), visible)):
+        with st.expander(f"Query {len(history) - i}: {item['query'][:50]}..."):
             st.write("**Question:**", item['query'])
             st.code(item['sql'], language="sql")
             st.write("**Results:**", f"{item['results']} rows")
             st.write("**Answer:**", item['answer'])
     
+    if len(history) > visible:
+        if st.button(f"⬇️ Load more ({len(history) - visible} older)"):
+            st.session_state.history_page += 1
+            st.rerun()
+    
     # Clear history button
     if st.button("🗑️ Clear History"):
-        st.session_state.query_history = []
+        st.session_state.query_history.clear()
+        st.session_state.history_page = 1
         st.rerun()
 
 
@@ -682,14 +728,14 @@ def show_example_queries_compact():
             for query in queries:
                 if st.button(query, key=f"example_{query[:30]}", use_container_width=True):
                     st.session_state.query_input = query
+                    st.session_state.auto_submit = True
                     st.rerun()
     
     # Quick stats
     st.markdown("---")
     st.markdown("##### 📊 Data Overview")
     if st.session_state.db_manager:
-        schema = st.session_state.db_manager.get_schema_info()
-        total_records = sum(info['row_count'] for info in schema.values())
+        total_records = st.session_state.db_manager.total_rows
         st.markdown(f"""
         <div style="font-size: 0.85rem; color: #666;">
         • <strong>3</strong> tables<br>
@@ -702,19 +748,7 @@ def show_example_queries_compact():
 def show_footer():
     """Display EnlitenAI footer"""
     st.markdown("---")
-    st.markdown("""
-    <div class="footer">
-        <p><strong>EnlitenAI</strong> - Decision Support Software Platform for Neurological Care</p>
-        <p style="font-size: 0.85rem; margin-top: 0.5rem;">
-            📧 <a href="mailto:info@enlitenai.com">info@enlitenai.com</a> | 
-            📞 (408) 483-1742 | 
-            🌐 <a href="https://enlitenai.com" target="_blank">enlitenai.com</a>
-        </p>
-        <p style="font-size: 0.8rem; color: #999; margin-top: 1rem;">
-            © 2025 EnlitenAI | All Rights Reserved
-        </p>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(load_asset("footer.html"), unsafe_allow_html=True)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,85 @@
 """
 Database utilities for loading CSV files into SQLite
 """
+import re
 import sqlite3
+import uuid
+import numpy as np
 import pandas as pd
 import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Tuple
+
+try:
+    import sqlglot
+except ImportError:
+    sqlglot = None
+
+
+# SQLite column affinity for each pandas dtype kind (int, unsigned, bool, float, object)
+SQLITE_TYPES = {"i": "INTEGER", "u": "INTEGER", "b": "INTEGER", "f": "REAL", "O": "TEXT"}
+
+# The database lives in memory and is rebuilt from the CSVs on every start,
+# so durability features only slow down the bulk load
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=OFF",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA temp_store=MEMORY",
+]
+
+# Operations the SQLite authorizer allows for user queries (read-only access)
+READ_ONLY_ACTIONS = frozenset({
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    sqlite3.SQLITE_RECURSIVE,
+})
+
+# Columns that queries typically filter or join on (patient_id, date, ...)
+INDEX_COLUMN_RE = re.compile(r"(_id$|^id$|date|timestamp)", re.IGNORECASE)
+
+# Queries must start with SELECT or WITH (a CTE); the authorizer still
+# enforces read-only access for whatever follows
+SELECT_RE = re.compile(r"\s*(select|with)\b", re.IGNORECASE)
+
+
+def csv_signature(csv_files: List[Path]) -> Tuple[Tuple[str, int, int], ...]:
+    """
+    Cheap fingerprint of CSV files: (name, mtime_ns, size) per file
+    Used as a hashable cache key instead of hashing the data itself.
+    """
+    signature = []
+    for csv_file in csv_files:
+        stat = csv_file.stat()
+        signature.append((csv_file.name, stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(signature))
+
+
+def data_signature(data_folder: str) -> Tuple[Tuple[str, int, int], ...]:
+    """Fingerprint of all CSV files in the data folder"""
+    return csv_signature(list(Path(data_folder).glob("*.csv")))
+
+
+def quote_identifier(name: str) -> str:
+    """Quote a table/column name for use in SQLite statements"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def canonical_sql(sql_query: str) -> str:
+    """
+    Normalized form of a query, so differently formatted copies of the same
+    query share cache entries. Uses sqlglot when it is installed, otherwise
+    only trims whitespace and a trailing semicolon (string literals must
+    stay untouched).
+    """
+    if sqlglot is not None:
+        try:
+            return sqlglot.parse_one(sql_query, read="sqlite").sql(dialect="sqlite")
+        except sqlglot.errors.SqlglotError:
+            pass
+    return sql_query.strip().rstrip(";").rstrip()
 
 
 class DatabaseManager:
@@ -13,37 +87,172 @@ class DatabaseManager:
     
     def __init__(self, data_folder: str = "data"):
         self.data_folder = data_folder
-        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
-        self.tables = {}
+        # Named in-memory database with a shared cache, so queries can open
+        # their own read-only connections to the same data; the name is
+        # unique per manager. This connection is only used for loading and
+        # keeps the database alive (it is dropped with its last connection).
+        self._uri = f"file:enliten-{uuid.uuid4().hex}?mode=memory&cache=shared"
+        self.conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+        for pragma in SQLITE_PRAGMAS:
+            self.conn.execute(pragma)
         self.schema_info = {}
+        self._schema_description = None
+        self.data_signature = ()
+        self.schema_columns = self._build_schema_columns()
+        self.stats_df = pd.DataFrame(columns=["Table", "Rows", "Columns"])
+        self.total_rows = 0
+    
+    @contextmanager
+    def _reader(self):
+        """
+        Short-lived read-only connection to the shared database
+        Every query gets its own, so queries never share a connection with
+        each other or with loading, whichever thread they run on.
+        """
+        with closing(sqlite3.connect(self._uri, uri=True)) as conn:
+            conn.execute("PRAGMA temp_store=MEMORY")
+            # Reject anything but reads inside the SQLite engine itself
+            conn.set_authorizer(self._authorize)
+            yield conn
+    
+    @staticmethod
+    def _authorize(action: int, arg1, arg2, db_name, trigger_name) -> int:
+        """SQLite authorizer callback allowing only read-only operations"""
+        if action in READ_ONLY_ACTIONS:
+            return sqlite3.SQLITE_OK
+        return sqlite3.SQLITE_DENY
+        
+    def load_csvs_to_db(self) -> Dict[str, Dict]:
+        """
+        Load all CSV files from data folder into SQLite tables
+        Returns the schema info; the data itself is only kept in SQLite.
+        """
+        csv_files = sorted(Path(self.data_folder).glob("*.csv"))
+        self.data_signature = csv_signature(csv_files)
+        
+        self._load_tables(csv_files)
         
-    def load_csvs_to_db(self) -> Dict[str, pd.DataFrame]:
-        """Load all CSV files from data folder into SQLite tables"""
-        csv_files = Path(self.data_folder).glob("*.csv")
+        # Schema is immutable after loading, so build the LLM description once
+        self._schema_description = self._build_schema_description()
         
-        for csv_file in csv_files:
-            table_name = csv_file.stem  # filename without extension
-            df = pd.read_csv(csv_file)
+        # Columnar schema and per-table statistics for the schema page and
+        # data overview
+        self.schema_columns = self._build_schema_columns()
+        table_names = self.schema_columns["table_names"]
+        row_counts = self.schema_columns["row_counts"]
+        self.stats_df = pd.DataFrame({
+            "Table": table_names,
+            "Rows": row_counts,
+            "Columns": np.bincount(self.schema_columns["col_table_idx"], minlength=len(table_names)),
+        })
+        self.total_rows = int(np.add.reduce(row_counts))
             
-            # Store DataFrame
-            self.tables[table_name] = df
+        return self.schema_info
+    
+    def _load_tables(self, csv_files: List[Path]):
+        """Read the CSV files and insert them into SQLite"""
+        # Tables whose dtypes have no direct SQLite mapping
+        fallback_tables = []
+        
+        # pd.read_csv releases the GIL while parsing, so read the files
+        # concurrently; SQLite inserts stay on this thread (one connection)
+        with ThreadPoolExecutor(max_workers=max(1, min(8, len(csv_files)))) as executor:
+            frames = executor.map(pd.read_csv, csv_files)
             
-            # Load into SQLite
+            # Insert all tables in a single transaction
+            self.conn.execute("BEGIN")
+            try:
+                for csv_file, df in zip(csv_files, frames):
+                    table_name = csv_file.stem  # filename without extension
+                    
+                    # Load into SQLite
+                    try:
+                        self._bulk_insert(table_name, df)
+                    except KeyError:
+                        fallback_tables.append((table_name, df))
+                    
+                    # Store schema info
+                    self.schema_info[table_name] = {
+                        "columns": list(df.columns),
+                        "dtypes": {col: str(dtype) for col, dtype in df.dtypes.items()},
+                        "row_count": len(df),
+                        "sample": df.head(3).to_csv(index=False)
+                    }
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        
+        for table_name, df in fallback_tables:
             df.to_sql(table_name, self.conn, if_exists="replace", index=False)
-            
-            # Store schema info
-            self.schema_info[table_name] = {
-                "columns": list(df.columns),
-                "dtypes": df.dtypes.to_dict(),
-                "row_count": len(df),
-                "sample": df.head(3).to_dict(orient='records')
-            }
-            
-        return self.tables
+        
+        self._create_indexes()
+    
+    def _create_indexes(self):
+        """Index likely filter/join columns (ids, dates) and collect planner stats"""
+        for table_name, info in self.schema_info.items():
+            for col in info["columns"]:
+                if INDEX_COLUMN_RE.search(str(col)):
+                    index_name = quote_identifier(f"idx_{table_name}_{col}")
+                    self.conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS {index_name} "
+                        f"ON {quote_identifier(table_name)} ({quote_identifier(col)})"
+                    )
+        
+        # Populate sqlite_stat1 so the query planner picks the indexes
+        self.conn.execute("ANALYZE")
+        self.conn.commit()
+    
+    def _bulk_insert(self, table_name: str, df: pd.DataFrame):
+        """
+        Create a table from the DataFrame and insert all rows with executemany
+        Raises KeyError if a column dtype has no SQLite mapping.
+        """
+        column_types = [SQLITE_TYPES[dtype.kind] for dtype in df.dtypes]
+        columns = ", ".join(
+            f"{quote_identifier(col)} {col_type}"
+            for col, col_type in zip(df.columns, column_types)
+        )
+        placeholders = ", ".join("?" * len(df.columns))
+        table = quote_identifier(table_name)
+        
+        self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+        self.conn.execute(f"CREATE TABLE {table} ({columns})")
+        self.conn.executemany(
+            f"INSERT INTO {table} VALUES ({placeholders})",
+            df.itertuples(index=False, name=None)
+        )
+    
+    def _build_schema_columns(self) -> Dict:
+        """
+        Flat columnar view of schema_info
+        table_names/row_counts have one entry per table; col_names/col_dtypes/
+        col_table_idx have one entry per column, col_table_idx pointing into
+        table_names. Names and dtypes are tuples, so the view is hashable for
+        st.cache_data.
+        """
+        col_names, col_dtypes, col_table_idx = [], [], []
+        for i, info in enumerate(self.schema_info.values()):
+            col_names.extend(info["dtypes"].keys())
+            col_dtypes.extend(info["dtypes"].values())
+            col_table_idx.extend([i] * len(info["dtypes"]))
+        return {
+            "table_names": tuple(self.schema_info),
+            "row_counts": np.array([info["row_count"] for info in self.schema_info.values()], dtype=np.int64),
+            "col_names": tuple(col_names),
+            "col_dtypes": tuple(col_dtypes),
+            "col_table_idx": np.array(col_table_idx, dtype=np.int64),
+        }
     
     def get_table_names(self) -> List[str]:
         """Get list of all table names"""
-        return list(self.tables.keys())
+        return list(self.schema_info.keys())
+    
+    def get_table(self, table_name: str) -> pd.DataFrame:
+        """Read a whole table back from SQLite as a DataFrame"""
+        if table_name not in self.schema_info:
+            raise KeyError(f"Unknown table: {table_name}")
+        return self.execute_query(f"SELECT * FROM {quote_identifier(table_name)}")
     
     def get_schema_info(self) -> Dict:
         """Get schema information for all tables"""
@@ -52,7 +261,13 @@ class DatabaseManager:
     def execute_query(self, sql_query: str) -> pd.DataFrame:
         """Execute SQL query and return results as DataFrame"""
         try:
-            result = pd.read_sql_query(sql_query, self.conn)
+            with self._reader() as conn:
+                try:
+                    # pyarrow-backed columns are cheaper to build and hold than
+                    # NumPy object columns, especially for wide/string results
+                    result = pd.read_sql_query(sql_query, conn, dtype_backend="pyarrow")
+                except ImportError:
+                    result = pd.read_sql_query(sql_query, conn)
             return result
         except Exception as e:
             raise Exception(f"Query execution error: {str(e)}")
@@ -62,47 +277,46 @@ class DatabaseManager:
         Validate SQL query for safety
         Returns: (is_valid, error_message)
         """
-        sql_lower = sql_query.lower().strip()
-        
-        # Dangerous commands
-        dangerous_keywords = [
-            'drop', 'delete', 'insert', 'update', 
-            'alter', 'create', 'truncate', 'exec',
-            'execute', 'grant', 'revoke'
-        ]
-        
-        for keyword in dangerous_keywords:
-            if keyword in sql_lower:
-                return False, f"Dangerous SQL keyword detected: {keyword}"
-        
-        # Must start with SELECT
-        if not sql_lower.startswith('select'):
+        # Cheap check first for a clear error message
+        if not SELECT_RE.match(sql_query):
             return False, "Only SELECT queries are allowed"
         
+        # Compile without running it; the authorizer rejects any write,
+        # schema change, PRAGMA or ATTACH and multiple statements fail here
+        try:
+            with self._reader() as conn:
+                conn.execute(f"EXPLAIN {sql_query}").close()
+        except sqlite3.Error as e:
+            return False, str(e)
+        
         return True, ""
     
     def get_schema_description(self) -> str:
         """Get human-readable schema description for LLM context"""
-        description = "Available tables and their schemas:\n\n"
+        if self._schema_description is None:
+            self._schema_description = self._build_schema_description()
+        return self._schema_description
+    
+    def _build_schema_description(self) -> str:
+        """Build the schema description string from schema_info"""
+        parts = ["Available tables and their schemas:\n\n"]
         
         for table_name, info in self.schema_info.items():
-            description += f"Table: {table_name}\n"
-            description += f"Columns: {', '.join(info['columns'])}\n"
-            description += f"Row count: {info['row_count']}\n"
+            parts.append(f"Table: {table_name}\n")
+            parts.append(f"Columns: {', '.join(info['columns'])}\n")
+            parts.append(f"Row count: {info['row_count']}\n")
             
             # Add data types
-            description += "Data types:\n"
-            for col, dtype in info['dtypes'].items():
-                description += f"  - {col}: {dtype}\n"
+            parts.append("Data types:\n")
+            parts.extend(f"  - {col}: {dtype}\n" for col, dtype in info['dtypes'].items())
             
             # Add sample data
-            description += f"Sample data (first 3 rows):\n"
-            for i, row in enumerate(info['sample'], 1):
-                description += f"  Row {i}: {row}\n"
+            parts.append("Sample data (first 3 rows, CSV):\n")
+            parts.extend(f"  {line}\n" for line in info['sample'].splitlines())
             
-            description += "\n"
+            parts.append("\n")
         
-        return description
+        return "".join(parts)
     
     def close(self):
         """Close database connection"""
@@ -2,30 +2,219 @@
 LLM utilities for text-to-SQL conversion and query explanation
 Supports both OpenAI and Google Gemini
 """
+import asyncio
+import contextlib
+import functools
+import json
 import os
-from typing import Tuple, Optional
-from openai import OpenAI
-import google.generativeai as genai
+import re
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Iterator, List, Tuple, Optional, Union
+
+# Provider SDKs are imported on first use, so an OpenAI-only deployment
+# never loads google.generativeai (and vice versa)
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from utils.rate_limit import RateLimiter
+from utils.sql_cache import SQLCache, cache_key
+
+
+# Static part of the text-to-SQL system prompt. It is identical for every
+# request and placed before the schema so providers can cache the prefix.
+# Kept terse on purpose: it is prefilled on every call.
+SQL_SYSTEM_PROMPT = """You write SQLite SELECT queries over patient data for physicians.
+Tables: assessments (QoL, Anxiety, Depression, Behavioral scores), medications (Med A-E dosages), seizures (daily_total, daily_severe counts).
+Rules: SELECT only. Exact column names; double-quote names with spaces. Aggregates for averages/statistics; order by date for trends. No explanations inside the SQL."""
+
+# Everything before the schema in the text-to-SQL system prompt
+SQL_SYSTEM_PREFIX = SQL_SYSTEM_PROMPT + "\n\nDatabase Schema:\n"
+
+# User prompts for text_to_sql (JSON) and text_to_sql_stream (markdown),
+# filled in with %-formatting of the question
+SQL_JSON_USER_PROMPT = """Convert this natural language query to SQL:
+"%s"
+
+Return a JSON object with two keys:
+- "sql": a clean SQL query that answers this question
+- "explanation": a brief, clear explanation (2-3 sentences) of what the query does, in simple terms a physician can understand"""
+
+SQL_STREAM_USER_PROMPT = """Convert this natural language query to SQL:
+"%s"
+
+Reply in exactly this format:
+<a brief, clear explanation (2-3 sentences) of what the query does, in simple terms a physician can understand>
+```sql
+<a clean SQL query that answers this question>
+```"""
+
+# Appended to SQL_JSON_USER_PROMPT when a generated query failed validation
+SQL_FIX_USER_PROMPT = """
+
+The SQL you produced before failed validation:
+%s
+Error: %s
+Return the corrected query in the same JSON format."""
+
+def is_transient_error(error: BaseException) -> bool:
+    """Rate limits, timeouts, dropped connections and 5xx errors, which are worth retrying"""
+    # Only look at SDKs that are already loaded (an error can't come from one that isn't)
+    openai = sys.modules.get("openai")
+    if openai is not None and isinstance(error, (
+        openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError
+    )):
+        return True
+    google_exceptions = sys.modules.get("google.api_core.exceptions")
+    if google_exceptions is not None and isinstance(error, (
+        google_exceptions.ResourceExhausted, google_exceptions.ServiceUnavailable,
+        google_exceptions.DeadlineExceeded, google_exceptions.InternalServerError
+    )):
+        return True
+    return False
+
+
+# Provider calls are retried with jittered exponential backoff on transient
+# errors; anything else (bad request, auth) fails immediately
+provider_retry = retry(
+    retry=retry_if_exception(is_transient_error),
+    wait=wait_random_exponential(min=1, max=30),
+    stop=stop_after_attempt(5),
+    reraise=True,
+)
+
+# Client-side request budget shared by all managers, so bursts (batches,
+# many sessions) queue up instead of running into provider 429s
+RATE_LIMITER = RateLimiter(int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")))
+
+
+@functools.lru_cache(maxsize=4)
+def get_openai_client(api_key: str, http_client: Optional["httpx.Client"] = None) -> "OpenAI":
+    """OpenAI client shared by all managers using the same key and HTTP pool"""
+    from openai import OpenAI
+    # Retries are done by provider_retry, not stacked on top of the SDK's own
+    return OpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+
+# google.generativeai has a single process-wide API key (genai.configure),
+# so there is one Gemini key at a time rather than a client per key
+_gemini_api_key: Optional[str] = None
+_gemini_lock = threading.Lock()
+
+
+def get_gemini_model(api_key: str, model: str):
+    """
+    Gemini GenerativeModel shared by all managers using the same model
+    A different key replaces the process-wide one and drops the shared
+    models, so managers created afterwards use the new key.
+    """
+    global _gemini_api_key
+    import google.generativeai as genai
+    with _gemini_lock:
+        if api_key != _gemini_api_key:
+            genai.configure(api_key=api_key)
+            _gemini_api_key = api_key
+            _gemini_model.cache_clear()
+        return _gemini_model(model)
+
+
+@functools.lru_cache(maxsize=4)
+def _gemini_model(model: str):
+    """GenerativeModel for the configured key (see get_gemini_model)"""
+    import google.generativeai as genai
+    return genai.GenerativeModel(model)
+
+
+# Generated SQL shared by all managers, keyed by provider, model and schema
+SQL_CACHE = SQLCache()
+
+
+# Shape of the JSON response of text_to_sql
+SQL_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "sql": {"type": "string"},
+        "explanation": {"type": "string"},
+    },
+    "required": ["sql", "explanation"],
+}
+
+# The same shape as an OpenAI strict JSON schema. With structured outputs the
+# model is decoded against it token by token, so "sql" can only be a bare
+# SELECT (or WITH ... SELECT) statement: no fences, no prose. Only the JSON
+# requests use it, not text_to_sql_stream. The pattern sticks to the regex
+# subset structured outputs supports (no \b)
+SQL_JSON_SCHEMA_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "sql_query",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "sql": {"type": "string", "pattern": r"^\s*(SELECT|WITH)\s"},
+                "explanation": {"type": "string"},
+            },
+            "required": ["sql", "explanation"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# OpenAI models that support structured outputs; older ones get plain JSON mode
+STRUCTURED_OUTPUT_MODEL_RE = re.compile(r"^(gpt-4o|gpt-4\.1|gpt-5|o3|o4)")
+
+
+# Markdown fences around a SQL query, or a bare "sql" line some models
+# emit in their place
+FENCE_RE = re.compile(r"\A\s*(?:```(?:sql)?|sql(?=[ \t]*\n))\s*|\s*```\s*\Z", re.IGNORECASE)
+
+# Explanation and the SQL block after it in the output of text_to_sql_stream
+# (the closing fence may be missing when the stream was stopped at a ';')
+STREAMED_SQL_RE = re.compile(r"(.*?)```(?:sql)?\s*(.*?)(?:```|\Z)", re.DOTALL | re.IGNORECASE)
 
 
 class LLMManager:
     """Manages LLM interactions for text-to-SQL with multi-provider support"""
     
-    def __init__(self, provider: Optional[str] = None, api_key: Optional[str] = None):
+    def __init__(self, provider: Optional[str] = None, api_key: Optional[str] = None,
+                 http_client: Optional["httpx.Client"] = None):
         """
         Initialize LLM Manager with specified provider
         
         Args:
             provider: 'openai' or 'gemini'. If None, uses LLM_PROVIDER env var or defaults to 'openai'
             api_key: API key for the selected provider. If None, tries to get from environment variable
+            http_client: Optional shared httpx client (connection pool) for OpenAI requests
         """
         self.provider = provider or os.getenv("LLM_PROVIDER", "openai").lower()
         self.api_key = api_key
+        self.http_client = http_client
         
+        # Prompt token totals, to see how much the prompt cache is hitting
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        
+        # Provider-specific calls are bound once here instead of branching
+        # on self.provider in every method
         if self.provider == "openai":
             self._init_openai()
+            self._gen_call = self._openai_call
+            self._stream_call = self._openai_stream
+            self._async_call = self._openai_call_async
+            self._async_client = self._openai_async_client
+            self._warm_up = self._openai_warm_up
         elif self.provider == "gemini":
             self._init_gemini()
+            self._gen_call = self._gemini_call
+            self._stream_call = self._gemini_stream
+            self._async_call = self._gemini_call_async
+            self._async_client = contextlib.nullcontext
+            self._warm_up = self._gemini_warm_up
         else:
             raise ValueError(f"Unsupported LLM provider: {self.provider}. Use 'openai' or 'gemini'")
     
@@ -35,20 +224,37 @@ class LLMManager:
         if not api_key:
             raise ValueError("OpenAI API key not provided. Please enter your API key.")
         
-        self.client = OpenAI(api_key=api_key)
-        self.model = "gpt-4-turbo-preview"
+        self._openai_api_key = api_key
+        self.client = get_openai_client(api_key, self.http_client)
+        self.model = "gpt-4o"
         print(f"✅ Using OpenAI ({self.model})")
     
+    def warm_up(self):
+        """
+        Open the connection to the provider ahead of the first query
+        so the TCP/TLS handshake isn't paid on the hot path
+        """
+        try:
+            self._warm_up()
+        except Exception:
+            pass
+    
+    def _openai_warm_up(self):
+        """Cheapest authenticated OpenAI request"""
+        provider_retry(self.client.models.list)()
+    
+    def _gemini_warm_up(self):
+        """Nothing to do: the Gemini SDK has no cheap request to open its channel with"""
+    
     def _init_gemini(self):
         """Initialize Google Gemini client"""
         api_key = self.api_key or os.getenv("GEMINI_API_KEY")
         if not api_key:
             raise ValueError("Gemini API key not provided. Please enter your API key.")
         
-        genai.configure(api_key=api_key)
         # Use Gemini 2.0 Flash - latest and fastest model
         self.model = "gemini-2.0-flash-exp"
-        self.client = genai.GenerativeModel(self.model)
+        self.client = get_gemini_model(api_key, self.model)
         print(f"✅ Using Google Gemini ({self.model})")
     
     def text_to_sql(self, natural_language_query: str, schema_description: str) -> Tuple[str, str]:
@@ -56,79 +262,449 @@ class LLMManager:
         Convert natural language query to SQL
         Returns: (sql_query, explanation)
         """
-        system_prompt = f"""You are a medical data SQL expert helping physicians query patient databases.
-
-Database Schema:
-{schema_description}
-
-Important Context:
-- This is medical/patient data for physicians
-- Tables contain: assessments (QoL, Anxiety, Depression, Behavioral scores), medications (Med A-E dosages), seizures (daily_total, daily_severe counts)
-- Always use proper SQL syntax for SQLite
-- Only generate SELECT queries
-- Be precise with column names
-- Use appropriate aggregations and filters
-- When asked about trends, use date ordering
-- When asked about averages or statistics, use aggregate functions
-
-Return ONLY valid SQL query, no explanations in the SQL itself."""
+        cached = self.cached_sql(natural_language_query, schema_description)
+        if cached is not None:
+            return cached
+        
+        system_prompt, user_prompt = self._sql_json_prompts(natural_language_query, schema_description)
 
-        user_prompt = f"""Convert this natural language query to SQL:
-"{natural_language_query}"
+        try:
+            # SQL and explanation come back from a single call
+            response = self._gen_call(system_prompt, user_prompt, json_output=True)
+            
+            sql_query, explanation = self._parse_sql_response(response)
+            
+            # Fall back to a separate call if the model skipped the explanation
+            if not explanation:
+                explanation = self._generate_explanation(natural_language_query, sql_query)
+            
+            return sql_query, explanation
+            
+        except Exception as e:
+            raise Exception(f"LLM error: {str(e)}")
+    
+    def fix_sql(self, natural_language_query: str, schema_description: str,
+                sql_query: str, error: str) -> Tuple[str, str]:
+        """
+        Ask for a corrected query after sql_query failed validation with error
+        Returns: (sql_query, explanation)
+        """
+        system_prompt, user_prompt = self._sql_json_prompts(natural_language_query, schema_description)
+        user_prompt += SQL_FIX_USER_PROMPT % (sql_query, error)
 
-Generate a clean SQL query that answers this question."""
+        try:
+            response = self._gen_call(system_prompt, user_prompt, json_output=True)
+            return self._parse_sql_response(response)
+        except Exception as e:
+            raise Exception(f"LLM error: {str(e)}")
+    
+    async def text_to_sql_async(self, natural_language_query: str, schema_description: str,
+                                async_client: Optional["AsyncOpenAI"] = None) -> Tuple[str, str]:
+        """
+        Async version of text_to_sql
+        Pass async_client to share one across many calls (see
+        text_to_sql_batch); otherwise one is opened for this call.
+        Returns: (sql_query, explanation)
+        """
+        cached = self.cached_sql(natural_language_query, schema_description)
+        if cached is not None:
+            return cached
+        
+        system_prompt, user_prompt = self._sql_json_prompts(natural_language_query, schema_description)
 
         try:
-            if self.provider == "openai":
-                sql_query = self._openai_generate(system_prompt, user_prompt)
-            else:  # gemini
-                sql_query = self._gemini_generate(system_prompt, user_prompt)
+            client_scope = (self._async_client() if async_client is None
+                            else contextlib.nullcontext(async_client))
+            async with client_scope as client:
+                response = await self._async_call(system_prompt, user_prompt, client)
             
-            # Clean up SQL query (remove markdown code blocks if present)
-            sql_query = self._clean_sql(sql_query)
+            sql_query, explanation = self._parse_sql_response(response)
             
-            # Generate explanation
-            explanation = self._generate_explanation(natural_language_query, sql_query)
+            # Fall back to a separate call if the model skipped the explanation
+            if not explanation:
+                explanation = await asyncio.to_thread(
+                    self._generate_explanation, natural_language_query, sql_query
+                )
             
             return sql_query, explanation
             
         except Exception as e:
             raise Exception(f"LLM error: {str(e)}")
     
-    def _openai_generate(self, system_prompt: str, user_prompt: str) -> str:
-        """Generate response using OpenAI"""
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[
+    @provider_retry
+    async def _openai_call_async(self, system_prompt: str, user_prompt: str,
+                                 async_client: "AsyncOpenAI") -> str:
+        """Generate a JSON SQL response with OpenAI without blocking the event loop"""
+        await RATE_LIMITER.acquire_async()
+        response = await async_client.chat.completions.create(
+            **self._openai_request(system_prompt, user_prompt, json_output=True)
+        )
+        self._record_openai_usage(response.usage)
+        return response.choices[0].message.content.strip()
+    
+    @provider_retry
+    async def _gemini_call_async(self, system_prompt: str, user_prompt: str, async_client: None = None) -> str:
+        """Generate a JSON SQL response with Gemini without blocking the event loop"""
+        await RATE_LIMITER.acquire_async()
+        response = await self.client.generate_content_async(
+            f"{system_prompt}\n\n{user_prompt}",
+            generation_config=self._gemini_config(json_output=True)
+        )
+        self._record_gemini_usage(response.usage_metadata)
+        return response.text.strip()
+    
+    def _openai_async_client(self) -> "AsyncOpenAI":
+        """
+        Async OpenAI client for one batch
+        It owns an event-loop bound connection pool, so it can't be shared.
+        """
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=self._openai_api_key, max_retries=0)
+    
+    async def text_to_sql_batch(self, queries: List[str], schema_description: str,
+                                max_concurrent: int = 4) -> List[Union[Tuple[str, str], Exception]]:
+        """
+        Convert several natural language queries to SQL concurrently
+        At most max_concurrent requests are in flight at once.
+        Returns one (sql_query, explanation) or Exception per query, in order
+        """
+        semaphore = asyncio.Semaphore(max_concurrent)
+        
+        async def convert(query: str, async_client: Optional["AsyncOpenAI"]) -> Tuple[str, str]:
+            async with semaphore:
+                return await self.text_to_sql_async(query, schema_description, async_client)
+        
+        # Only OpenAI needs an async client (None for Gemini)
+        async with self._async_client() as async_client:
+            return await asyncio.gather(
+                *(convert(query, async_client) for query in queries),
+                return_exceptions=True
+            )
+    
+    def text_to_sql_many(self, queries: List[str], schema_description: str,
+                         max_concurrent: int = 4) -> List[Union[Tuple[str, str], Exception]]:
+        """Blocking wrapper around text_to_sql_batch for synchronous callers"""
+        return asyncio.run(self.text_to_sql_batch(queries, schema_description, max_concurrent))
+    
+    def text_to_sql_batch_offline(self, queries: List[str], schema_description: str,
+                                  poll_interval: float = 10.0,
+                                  max_poll_interval: float = 300.0) -> List[Union[Tuple[str, str], Exception]]:
+        """
+        Convert many natural language queries to SQL with the OpenAI Batch API
+        For non-interactive bulk runs: the batch completes within 24 hours
+        at half the price of live requests. Blocks until the batch is done,
+        polling with exponential backoff.
+        Returns one (sql_query, explanation) or Exception per query, in order
+        """
+        if self.provider != "openai":
+            raise ValueError("Offline batches are only supported for OpenAI")
+        
+        lines = []
+        for i, query in enumerate(queries):
+            system_prompt, user_prompt = self._sql_json_prompts(query, schema_description)
+            lines.append(json.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self._openai_request(system_prompt, user_prompt, json_output=True),
+            }))
+        
+        # The shared client doesn't retry on its own, so every request here is
+        # wrapped in provider_retry; a transient error while polling must not
+        # abandon a batch that may run for hours
+        batch = None
+        try:
+            input_file = provider_retry(self.client.files.create)(
+                file=("text_to_sql_batch.jsonl", "\n".join(lines).encode()),
+                purpose="batch"
+            )
+            batch = provider_retry(self.client.batches.create)(
+                input_file_id=input_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h"
+            )
+            
+            while batch.status not in ("completed", "failed", "expired", "cancelled"):
+                time.sleep(poll_interval)
+                poll_interval = min(poll_interval * 2, max_poll_interval)
+                batch = provider_retry(self.client.batches.retrieve)(batch.id)
+            
+            # Expired batches still return the requests that finished in time
+            download = provider_retry(self.client.files.content)
+            output = download(batch.output_file_id).text if batch.output_file_id else ""
+            errors = download(batch.error_file_id).text if batch.error_file_id else ""
+        except Exception as e:
+            # Once submitted, the batch keeps running; its id lets it be recovered
+            if batch is not None:
+                raise Exception(f"LLM error: batch {batch.id}: {str(e)}")
+            raise Exception(f"LLM error: {str(e)}")
+        
+        results: List[Union[Tuple[str, str], Exception]] = [
+            Exception(f"LLM error: batch {batch.id} {batch.status} without a result for this query")
+            for _ in queries
+        ]
+        for line in (output + "\n" + errors).splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            i = int(item["custom_id"])
+            response = item.get("response") or {}
+            if item.get("error") or response.get("status_code") != 200:
+                error = item.get("error") or response.get("body", {}).get("error")
+                results[i] = Exception(f"LLM error: {error}")
+                continue
+            content = response["body"]["choices"][0]["message"]["content"].strip()
+            results[i] = self._parse_sql_response(content)
+        return results
+    
+    def cached_sql(self, natural_language_query: str, schema_description: str) -> Optional[Tuple[str, str]]:
+        """
+        (sql_query, explanation) previously generated for this question or
+        a close paraphrase of it, or None
+        """
+        return SQL_CACHE.get(self._sql_cache_scope(schema_description), natural_language_query)
+    
+    def cache_sql(self, natural_language_query: str, schema_description: str,
+                  sql_query: str, explanation: str):
+        """
+        Remember the SQL generated for a question (see cached_sql)
+        Only call this once the query has passed validation: cached SQL is
+        replayed without being regenerated.
+        """
+        SQL_CACHE.set(self._sql_cache_scope(schema_description), natural_language_query,
+                      sql_query, explanation)
+    
+    def clear_cache(self):
+        """Forget all cached SQL, for every provider and schema"""
+        SQL_CACHE.clear()
+    
+    def _sql_cache_scope(self, schema_description: str) -> str:
+        """Cache scope: SQL is only reused for the same provider, model and schema"""
+        return cache_key(self.provider, self.model, schema_description)
+    
+    def _sql_json_prompts(self, natural_language_query: str, schema_description: str) -> Tuple[str, str]:
+        """System and user prompts asking for SQL and explanation as JSON"""
+        system_prompt = self._sql_system_prompt(schema_description)
+        user_prompt = SQL_JSON_USER_PROMPT % natural_language_query
+        return system_prompt, user_prompt
+    
+    def text_to_sql_stream(self, natural_language_query: str, schema_description: str) -> Iterator[str]:
+        """
+        Stream the explanation and then the SQL query as markdown chunks
+        Generation stops as soon as the SQL block is complete, so the model
+        isn't left writing tokens nobody reads. The completed text can be
+        split with parse_streamed_sql().
+        The output is free text, not constrained by SQL_JSON_SCHEMA_FORMAT,
+        so the SQL must still go through DatabaseManager.validate_sql.
+        """
+        system_prompt = self._sql_system_prompt(schema_description)
+        user_prompt = SQL_STREAM_USER_PROMPT % natural_language_query
+
+        try:
+            yield from self._stream_generate(system_prompt, user_prompt, temperature=0.1, max_tokens=500,
+                                             stop=self._sql_block_complete)
+        except Exception as e:
+            raise Exception(f"LLM error: {str(e)}")
+    
+    @staticmethod
+    def _sql_block_complete(streamed_text: str) -> bool:
+        """True once the SQL block of a streamed reply is closed or ends with a ';' outside quotes"""
+        _, fence, sql_block = streamed_text.partition("```")
+        if not fence:
+            return False
+        if "```" in sql_block:
+            return True
+        if not sql_block.rstrip().endswith(";"):
+            return False
+        # A ';' inside a string literal ('a;b') doesn't end the query;
+        # doubled quotes ('it''s') toggle out and back in
+        quote = None
+        for char in sql_block:
+            if quote is None and char in "'\"":
+                quote = char
+            elif char == quote:
+                quote = None
+        return quote is None
+    
+    def parse_streamed_sql(self, streamed_text: str) -> Tuple[str, str]:
+        """
+        Split the completed output of text_to_sql_stream
+        Returns: (sql_query, explanation)
+        """
+        match = STREAMED_SQL_RE.search(streamed_text)
+        if not match:
+            return self._clean_sql(streamed_text.strip()), ""
+        return match.group(2).strip(), match.group(1).strip()
+    
+    def _sql_system_prompt(self, schema_description: str) -> str:
+        """
+        System prompt for text-to-SQL generation
+        The static instructions come first so that every request shares a
+        byte-identical prefix, which the provider's prompt cache can reuse.
+        """
+        return SQL_SYSTEM_PREFIX + schema_description
+    
+    def _record_usage(self, prompt_tokens: Optional[int], cached_tokens: Optional[int]):
+        """Add one response's prompt token counts to the running totals"""
+        self.prompt_tokens += prompt_tokens or 0
+        self.cached_prompt_tokens += cached_tokens or 0
+    
+    def _record_openai_usage(self, usage):
+        """Track prompt and prompt-cache-hit tokens of an OpenAI response"""
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        self._record_usage(usage.prompt_tokens, getattr(details, "cached_tokens", None))
+    
+    def _record_gemini_usage(self, usage):
+        """Track prompt and cached-content tokens of a Gemini response"""
+        if usage is None:
+            return
+        self._record_usage(usage.prompt_token_count, getattr(usage, "cached_content_token_count", None))
+    
+    def _stream_generate(self, system_prompt: str, user_prompt: str, temperature: float,
+                         max_tokens: int, stop: Optional[Callable[[str], bool]] = None) -> Iterator[str]:
+        """
+        Stream response text chunks from the configured provider
+        If stop is given, the response is abandoned as soon as stop(text so far)
+        returns True.
+        """
+        return self._stream_call(system_prompt, user_prompt, temperature, max_tokens, stop)
+    
+    def _openai_stream(self, system_prompt: str, user_prompt: str, temperature: float,
+                       max_tokens: int, stop: Optional[Callable[[str], bool]]) -> Iterator[str]:
+        """Stream response text chunks from OpenAI (see _stream_generate)"""
+        streamed_text = ""
+        response = self._openai_open_stream(system_prompt, user_prompt, temperature, max_tokens)
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+                streamed_text += chunk.choices[0].delta.content
+                if stop is not None and stop(streamed_text):
+                    response.close()
+                    return
+            self._record_openai_usage(getattr(chunk, "usage", None))
+    
+    def _gemini_stream(self, system_prompt: str, user_prompt: str, temperature: float,
+                       max_tokens: int, stop: Optional[Callable[[str], bool]]) -> Iterator[str]:
+        """Stream response text chunks from Gemini (see _stream_generate)"""
+        streamed_text = ""
+        response = self._gemini_open_stream(system_prompt, user_prompt, temperature, max_tokens)
+        usage = None
+        for chunk in response:
+            usage = chunk.usage_metadata
+            if chunk.parts:
+                yield chunk.text
+                streamed_text += chunk.text
+                if stop is not None and stop(streamed_text):
+                    break
+        self._record_gemini_usage(usage)
+    
+    @provider_retry
+    def _openai_open_stream(self, system_prompt: str, user_prompt: str, temperature: float, max_tokens: int):
+        """Start a streaming OpenAI completion (retried until the request is accepted)"""
+        RATE_LIMITER.acquire()
+        return self.client.chat.completions.create(
+            **self._openai_request(system_prompt, user_prompt, temperature=temperature, max_tokens=max_tokens),
+            stream=True,
+            # Usage arrives in a final chunk without choices
+            stream_options={"include_usage": True}
+        )
+    
+    @provider_retry
+    def _gemini_open_stream(self, system_prompt: str, user_prompt: str, temperature: float, max_tokens: int):
+        """Start a streaming Gemini completion (retried until the request is accepted)"""
+        RATE_LIMITER.acquire()
+        return self.client.generate_content(
+            f"{system_prompt}\n\n{user_prompt}",
+            generation_config=self._gemini_config(temperature=temperature, max_tokens=max_tokens),
+            stream=True
+        )
+    
+    def _openai_request(self, system_prompt: str, user_prompt: str, json_output: bool = False,
+                        temperature: float = 0.1, max_tokens: Optional[int] = None) -> dict:
+        """
+        Keyword arguments for an OpenAI chat completion
+        The defaults are those of SQL generation.
+        """
+        request = {
+            "model": self.model,
+            "messages": [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
-            temperature=0.1,
-            max_tokens=500
+            "temperature": temperature,
+            # Room for both the SQL and the explanation in JSON mode
+            "max_tokens": max_tokens or (700 if json_output else 500),
+        }
+        if json_output:
+            if STRUCTURED_OUTPUT_MODEL_RE.match(self.model):
+                request["response_format"] = SQL_JSON_SCHEMA_FORMAT
+            else:
+                request["response_format"] = {"type": "json_object"}
+        return request
+    
+    def _gemini_config(self, json_output: bool = False, temperature: float = 0.1,
+                       max_tokens: Optional[int] = None) -> dict:
+        """
+        Generation config for a Gemini request
+        The defaults are those of SQL generation.
+        """
+        generation_config = {
+            'temperature': temperature,
+            'max_output_tokens': max_tokens or (700 if json_output else 500),
+        }
+        if json_output:
+            generation_config['response_mime_type'] = 'application/json'
+            generation_config['response_schema'] = SQL_RESPONSE_SCHEMA
+        return generation_config
+    
+    @provider_retry
+    def _openai_call(self, system_prompt: str, user_prompt: str, temperature: float = 0.1,
+                     max_tokens: Optional[int] = None, json_output: bool = False) -> str:
+        """Generate a response using OpenAI (JSON SQL response when json_output)"""
+        RATE_LIMITER.acquire()
+        response = self.client.chat.completions.create(
+            **self._openai_request(system_prompt, user_prompt, json_output, temperature, max_tokens)
         )
+        self._record_openai_usage(response.usage)
         return response.choices[0].message.content.strip()
     
-    def _gemini_generate(self, system_prompt: str, user_prompt: str) -> str:
-        """Generate response using Google Gemini"""
+    @provider_retry
+    def _gemini_call(self, system_prompt: str, user_prompt: str, temperature: float = 0.1,
+                     max_tokens: Optional[int] = None, json_output: bool = False) -> str:
+        """Generate a response using Google Gemini (JSON SQL response when json_output)"""
+        RATE_LIMITER.acquire()
         # Gemini doesn't have separate system/user roles, combine them
-        full_prompt = f"{system_prompt}\n\n{user_prompt}"
-        
         response = self.client.generate_content(
-            full_prompt,
-            generation_config={
-                'temperature': 0.1,
-                'max_output_tokens': 500,
-            }
+            f"{system_prompt}\n\n{user_prompt}",
+            generation_config=self._gemini_config(json_output, temperature, max_tokens)
         )
+        self._record_gemini_usage(response.usage_metadata)
         return response.text.strip()
     
+    def _parse_sql_response(self, response: str) -> Tuple[str, str]:
+        """
+        Parse the JSON response of text_to_sql
+        Returns: (sql_query, explanation); falls back to treating the whole
+        response as SQL with an empty explanation if it isn't valid JSON of
+        the expected shape
+        """
+        try:
+            data = json.loads(response)
+            sql_query = data["sql"]
+            explanation = data.get("explanation") or ""
+            if not isinstance(sql_query, str) or not isinstance(explanation, str):
+                raise TypeError("sql and explanation must be strings")
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return self._clean_sql(response), ""
+        
+        # Clean up SQL query (remove markdown code blocks if present)
+        return self._clean_sql(sql_query.strip()), explanation.strip()
+    
     def _clean_sql(self, sql_query: str) -> str:
         """Clean SQL query by removing markdown formatting"""
-        if sql_query.startswith("```sql"):
-            sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
-        elif sql_query.startswith("```"):
-            sql_query = sql_query.replace("```", "").strip()
-        return sql_query
+        return FENCE_RE.sub("", sql_query).strip()
     
     def _generate_explanation(self, question: str, sql_query: str) -> str:
         """Generate human-readable explanation of the SQL query"""
@@ -142,35 +718,12 @@ The generated SQL query is:
 Provide a brief, clear explanation (2-3 sentences) of what this query does."""
 
         try:
-            if self.provider == "openai":
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    temperature=0.3,
-                    max_tokens=200
-                )
-                explanation = response.choices[0].message.content.strip()
-            else:  # gemini
-                full_prompt = f"{system_prompt}\n\n{user_prompt}"
-                response = self.client.generate_content(
-                    full_prompt,
-                    generation_config={
-                        'temperature': 0.3,
-                        'max_output_tokens': 200,
-                    }
-                )
-                explanation = response.text.strip()
-            
-            return explanation
-            
+            return self._gen_call(system_prompt, user_prompt, 0.3, 200)
         except Exception as e:
             return "Query explanation unavailable."
     
-    def generate_answer(self, question: str, query_result: str) -> str:
-        """Generate natural language answer from query results"""
+    def _answer_prompts(self, question: str, query_result: str) -> Tuple[str, str]:
+        """System and user prompts for summarizing query results"""
         system_prompt = """You are a medical data assistant helping physicians understand patient data.
 Provide clear, concise answers based on the query results.
 Use medical terminology appropriately.
@@ -182,31 +735,25 @@ Query Results:
 {query_result}
 
 Provide a clear, professional answer to the physician's question based on these results."""
+        return system_prompt, user_prompt
+    
+    def stream_answer(self, question: str, query_result: str) -> Iterator[str]:
+        """
+        Stream a natural language answer from query results
+        Provider errors are raised (as in text_to_sql_stream) so that callers
+        can tell a failure apart from an answer.
+        """
+        system_prompt, user_prompt = self._answer_prompts(question, query_result)
+        try:
+            yield from self._stream_generate(system_prompt, user_prompt, temperature=0.5, max_tokens=300)
+        except Exception as e:
+            raise Exception(f"LLM error: {str(e)}")
+    
+    def generate_answer(self, question: str, query_result: str) -> str:
+        """Generate natural language answer from query results"""
+        system_prompt, user_prompt = self._answer_prompts(question, query_result)
 
         try:
-            if self.provider == "openai":
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    temperature=0.5,
-                    max_tokens=300
-                )
-                answer = response.choices[0].message.content.strip()
-            else:  # gemini
-                full_prompt = f"{system_prompt}\n\n{user_prompt}"
-                response = self.client.generate_content(
-                    full_prompt,
-                    generation_config={
-                        'temperature': 0.5,
-                        'max_output_tokens': 300,
-                    }
-                )
-                answer = response.text.strip()
-            
-            return answer
-            
+            return self._gen_call(system_prompt, user_prompt, 0.5, 300)
         except Exception as e:
             return "Unable to generate answer summary."
@@ -0,0 +1,44 @@
+"""
+Client-side request rate limiting for LLM provider calls
+"""
+import asyncio
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Token bucket allowing requests_per_minute requests per minute (0 = unlimited)
+    Shared by threads and event loops: each caller reserves a slot under the
+    lock and then waits for it outside of it.
+    """
+
+    def __init__(self, requests_per_minute: int = 0):
+        self.requests_per_minute = requests_per_minute
+        self._tokens = float(requests_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a slot; returns how many seconds to wait before using it"""
+        if self.requests_per_minute <= 0:
+            return 0.0
+        rate = self.requests_per_minute / 60.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.requests_per_minute, self._tokens + (now - self._updated) * rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / rate
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        """Wait, without blocking the event loop, until a request may be sent"""
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
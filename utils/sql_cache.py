@@ -0,0 +1,164 @@
+"""
+Cache of generated SQL for repeated and paraphrased questions
+Exact matches are kept in memory; paraphrases are matched by embedding
+similarity when sentence-transformers is installed, against a SQLite
+store on disk that survives restarts
+"""
+import functools
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from cachetools import LRUCache
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Paraphrases must be at least this similar (cosine) to reuse the cached SQL
+SIMILARITY_THRESHOLD = 0.95
+
+DEFAULT_STORE_PATH = Path(".cache") / "sql_cache.sqlite"
+
+# Values a paraphrase must repeat exactly: quoted strings and any token with
+# a digit (patient IDs like P001, numbers, dates). Embeddings barely tell
+# "patient P001" from "patient P002", so these are compared separately.
+LITERAL_RE = re.compile(r"'[^']*'|\"[^\"]*\"|[\w.:/-]*\d[\w.:/-]*")
+
+
+def question_literals(question: str) -> frozenset:
+    """Literal values in a question (see LITERAL_RE), case-insensitive"""
+    return frozenset(match.casefold() for match in LITERAL_RE.findall(question))
+
+
+def cache_key(*parts: str) -> str:
+    """Short stable key for a schema/model/question combination"""
+    return hashlib.blake2b("\0".join(parts).encode(), digest_size=16).hexdigest()
+
+
+@functools.lru_cache(maxsize=1)
+def get_embedder():
+    """Embedding model, loaded on first use (None without sentence-transformers)"""
+    if SentenceTransformer is None:
+        return None
+    return SentenceTransformer(EMBEDDING_MODEL)
+
+
+class SQLCache:
+    """Exact-match LRU cache plus an optional on-disk semantic cache of (sql, explanation)"""
+
+    def __init__(self, maxsize: int = 512, store_path: Optional[str] = None):
+        self._lock = threading.Lock()
+        self._exact = LRUCache(maxsize=maxsize)
+        self._store_path = Path(store_path or os.getenv("SQL_CACHE_PATH", DEFAULT_STORE_PATH))
+        self._conn: Optional[sqlite3.Connection] = None
+        # Per scope (schema + model): stacked unit embeddings, the literals of
+        # each stored question and their answers
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._literals: Dict[str, List[frozenset]] = {}
+        self._answers: Dict[str, List[Tuple[str, str]]] = {}
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return SentenceTransformer is not None
+
+    def get(self, scope: str, question: str) -> Optional[Tuple[str, str]]:
+        """
+        Cached (sql, explanation) for a question, or None
+        scope identifies the schema and model the SQL was generated for.
+        """
+        key = cache_key(scope, question)
+        with self._lock:
+            hit = self._exact.get(key)
+        if hit is not None or not self.semantic_enabled:
+            return hit
+
+        query_vector = self._embed(question)
+        literals = question_literals(question)
+        with self._lock:
+            self._load_scope(scope)
+            vectors = self._vectors[scope]
+            if not len(vectors):
+                return None
+            scores = vectors @ query_vector
+            # Most similar first; a paraphrase only counts if it asks about
+            # the same patients, numbers and dates
+            for i in np.argsort(scores)[::-1]:
+                if scores[i] < SIMILARITY_THRESHOLD:
+                    return None
+                if self._literals[scope][i] == literals:
+                    hit = self._answers[scope][i]
+                    self._exact[key] = hit
+                    return hit
+            return None
+
+    def set(self, scope: str, question: str, sql_query: str, explanation: str):
+        """Store the SQL generated for a question"""
+        value = (sql_query, explanation)
+        with self._lock:
+            self._exact[cache_key(scope, question)] = value
+        if not self.semantic_enabled:
+            return
+
+        query_vector = self._embed(question)
+        with self._lock:
+            self._load_scope(scope)
+            self._vectors[scope] = np.vstack([self._vectors[scope], query_vector])
+            self._literals[scope].append(question_literals(question))
+            self._answers[scope].append(value)
+            conn = self._connection()
+            conn.execute(
+                "INSERT INTO sql_cache (scope, question, embedding, sql, explanation) VALUES (?, ?, ?, ?, ?)",
+                (scope, question, query_vector.tobytes(), sql_query, explanation)
+            )
+            conn.commit()
+
+    def clear(self):
+        """Drop every cached entry, including the on-disk store"""
+        with self._lock:
+            self._exact.clear()
+            self._vectors.clear()
+            self._literals.clear()
+            self._answers.clear()
+            if self._conn is not None or self._store_path.exists():
+                conn = self._connection()
+                conn.execute("DELETE FROM sql_cache")
+                conn.commit()
+
+    def _embed(self, question: str) -> np.ndarray:
+        """Unit-length float32 embedding, so the dot product is the cosine similarity"""
+        return get_embedder().encode(question, normalize_embeddings=True).astype(np.float32)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open (and create if needed) the on-disk store; caller holds the lock"""
+        if self._conn is None:
+            self._store_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self._store_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sql_cache "
+                "(scope TEXT, question TEXT, embedding BLOB, sql TEXT, explanation TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sql_cache_scope ON sql_cache (scope)")
+        return self._conn
+
+    def _load_scope(self, scope: str):
+        """Read a scope's entries from disk the first time it is used; caller holds the lock"""
+        if scope in self._vectors:
+            return
+        rows = self._connection().execute(
+            "SELECT question, embedding, sql, explanation FROM sql_cache WHERE scope = ?", (scope,)
+        ).fetchall()
+        dim = get_embedder().get_sentence_embedding_dimension()
+        vectors = [np.frombuffer(embedding, dtype=np.float32) for _, embedding, _, _ in rows]
+        self._vectors[scope] = np.vstack(vectors) if vectors else np.empty((0, dim), dtype=np.float32)
+        self._literals[scope] = [question_literals(question) for question, _, _, _ in rows]
+        self._answers[scope] = [(sql_query, explanation) for _, _, sql_query, explanation in rows]
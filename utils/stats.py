@@ -0,0 +1,79 @@
+"""
+Numeric summary helpers for query results
+Kernels are compiled with Numba when it is installed, plain NumPy otherwise
+"""
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """Fallback when Numba isn't installed: leave the function as is"""
+        def decorator(func):
+            return func
+        return decorator
+
+
+@njit(cache=True, nogil=True)
+def mean(x: np.ndarray) -> float:
+    """Arithmetic mean of a float64 array"""
+    if x.size == 0:
+        return np.nan
+    return x.sum() / x.size
+
+
+@njit(cache=True, nogil=True)
+def std(x: np.ndarray) -> float:
+    """Sample standard deviation (ddof=1, same as pandas) of a float64 array"""
+    if x.size < 2:
+        return np.nan
+    dx = x - x.sum() / x.size
+    return np.sqrt((dx * dx).sum() / (x.size - 1))
+
+
+@njit(cache=True, nogil=True)
+def pearson(x: np.ndarray, y: np.ndarray) -> float:
+    """Pearson correlation coefficient of two float64 arrays of equal length"""
+    if x.size < 2:
+        return np.nan
+    dx = x - x.sum() / x.size
+    dy = y - y.sum() / y.size
+    denom = np.sqrt((dx * dx).sum() * (dy * dy).sum())
+    if denom == 0.0:
+        return np.nan
+    return (dx * dy).sum() / denom
+
+
+def numeric_columns(df: pd.DataFrame) -> dict:
+    """Numeric (non-boolean) columns of a DataFrame as float64 arrays, NaN for nulls"""
+    return {
+        col: df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        for col in df.columns
+        if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])
+    }
+
+
+def numeric_summary(df: pd.DataFrame) -> str:
+    """
+    Compact text summary of the numeric columns of a DataFrame
+    (count, mean, std, min, max per column, plus the correlation when
+    there are exactly two numeric columns)
+    """
+    columns = numeric_columns(df)
+    lines = []
+    for col, values in columns.items():
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            continue
+        lines.append(
+            f"{col}: count={values.size}, mean={mean(values):.4g}, std={std(values):.4g}, "
+            f"min={values.min():.4g}, max={values.max():.4g}"
+        )
+
+    if len(columns) == 2:
+        (col_x, x), (col_y, y) = columns.items()
+        valid = ~(np.isnan(x) | np.isnan(y))
+        lines.append(f"correlation({col_x}, {col_y}) = {pearson(x[valid], y[valid]):.4f}")
+
+    return "\n".join(lines)
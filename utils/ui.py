@@ -1,8 +1,17 @@
 """
 UI helper functions for Streamlit app
 """
+import io
 import streamlit as st
+import numpy as np
 import pandas as pd
+import sqlparse
+
+
+_METRIC_TMPL = """<div class="metric-card">
+<h3 style="color: #0066cc; margin: 0;">{value}</h3>
+<p style="margin: 0.5rem 0 0 0; color: #666;">{label}</p>
+</div>"""
 
 
 def display_query_results(df: pd.DataFrame, max_rows: int = 100):
@@ -16,18 +25,18 @@ def display_query_results(df: pd.DataFrame, max_rows: int = 100):
         """, unsafe_allow_html=True)
         return
     
-    # Results summary
+    # Results summary, divider and heading as a single element
     st.markdown(f"""
-    <div class="success-box">
-        <strong>✅ Query Successful</strong><br>
-        Found <strong>{len(df):,}</strong> rows × <strong>{len(df.columns)}</strong> columns
-    </div>
-    """, unsafe_allow_html=True)
-    
-    st.markdown("---")
+<div class="success-box">
+    <strong>✅ Query Successful</strong><br>
+    Found <strong>{len(df):,}</strong> rows × <strong>{len(df.columns)}</strong> columns
+</div>
+
+---
+#### 📊 Results
+""", unsafe_allow_html=True)
     
     # Display dataframe with better styling
-    st.markdown("#### 📊 Results")
     st.dataframe(
         df.head(max_rows), 
         use_container_width=True,
@@ -38,7 +47,7 @@ def display_query_results(df: pd.DataFrame, max_rows: int = 100):
         st.info(f"📋 Showing first {max_rows:,} of {len(df):,} rows. Download CSV for complete data.")
     
     # Download button with better styling
-    csv = df.to_csv(index=False)
+    csv = _csv_bytes(df)
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
         st.download_button(
@@ -50,61 +59,78 @@ def display_query_results(df: pd.DataFrame, max_rows: int = 100):
         )
 
 
-def display_schema_info(schema_info: dict):
-    """Display database schema information in a professional format"""
+@st.cache_data(max_entries=32, show_spinner=False)
+def _csv_bytes(df: pd.DataFrame) -> bytes:
+    """
+    CSV export of query results, serialized once per result set
+    Uses pyarrow's CSV writer (much faster on large frames) when available.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+        buffer = pa.BufferOutputStream()
+        pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), buffer)
+        return buffer.getvalue().to_pybytes()
+    except Exception:
+        # pyarrow not installed, or column types it can't convert
+        return df.to_csv(index=False).encode()
+
+
+def display_schema_info(schema_info: dict, schema_columns: dict):
+    """
+    Display database schema information in a professional format
+    schema_columns is the columnar view of schema_info (DatabaseManager.schema_columns)
+    """
+    table_names = schema_columns['table_names']
+    row_counts = schema_columns['row_counts']
+    col_table_idx = schema_columns['col_table_idx']
     
     # Summary metrics
-    total_tables = len(schema_info)
-    total_rows = sum(info['row_count'] for info in schema_info.values())
-    
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.markdown(f"""
-        <div class="metric-card">
-            <h3 style="color: #0066cc; margin: 0;">🗄️ {total_tables}</h3>
-            <p style="margin: 0.5rem 0 0 0; color: #666;">Tables</p>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col2:
-        st.markdown(f"""
-        <div class="metric-card">
-            <h3 style="color: #0066cc; margin: 0;">📊 {total_rows:,}</h3>
-            <p style="margin: 0.5rem 0 0 0; color: #666;">Total Records</p>
-        </div>
-        """, unsafe_allow_html=True)
+    total_tables = len(table_names)
+    total_rows = int(np.add.reduce(row_counts))
+    total_columns = len(schema_columns['col_names'])
     
-    with col3:
-        total_columns = sum(len(info['dtypes']) for info in schema_info.values())
-        st.markdown(f"""
-        <div class="metric-card">
-            <h3 style="color: #0066cc; margin: 0;">🔢 {total_columns}</h3>
-            <p style="margin: 0.5rem 0 0 0; color: #666;">Total Columns</p>
-        </div>
-        """, unsafe_allow_html=True)
+    # All three cards in one element instead of three columns
+    cards = "".join(
+        _METRIC_TMPL.format(value=value, label=label)
+        for value, label in (
+            (f"🗄️ {total_tables}", "Tables"),
+            (f"📊 {total_rows:,}", "Total Records"),
+            (f"🔢 {total_columns}", "Total Columns"),
+        )
+    )
+    st.markdown(f'<div class="metric-row">{cards}</div>', unsafe_allow_html=True)
     
     st.markdown("---")
     
     # Table details
-    for table_name, info in schema_info.items():
-        with st.expander(f"**📋 {table_name}** ({info['row_count']:,} rows)", expanded=False):
+    columns_df = _schema_columns_df(schema_columns['col_names'], schema_columns['col_dtypes'])
+    for i, table_name in enumerate(table_names):
+        with st.expander(f"**📋 {table_name}** ({row_counts[i]:,} rows)", expanded=False):
             st.markdown("##### Column Information")
             
-            # Create columns info
-            col_df = pd.DataFrame([
-                {"Column Name": col, "Data Type": str(dtype)} 
-                for col, dtype in info['dtypes'].items()
-            ])
-            st.dataframe(col_df, use_container_width=True, hide_index=True)
+            st.dataframe(columns_df[col_table_idx == i], use_container_width=True, hide_index=True)
             
             st.markdown("##### Sample Data Preview")
-            sample_df = pd.DataFrame(info['sample'])
+            sample_df = _sample_df(schema_info[table_name]['sample'])
             st.dataframe(sample_df, use_container_width=True, hide_index=True)
 
 
+@st.cache_data(max_entries=16, show_spinner=False)
+def _schema_columns_df(col_names: tuple, col_dtypes: tuple) -> pd.DataFrame:
+    """Column name/type table of all database tables, built from the columnar schema"""
+    return pd.DataFrame({"Column Name": col_names, "Data Type": col_dtypes})
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _sample_df(sample_csv: str) -> pd.DataFrame:
+    """Sample rows of one table (stored in schema_info as a pre-formatted CSV string)"""
+    return pd.read_csv(io.StringIO(sample_csv))
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
 def format_sql_query(sql: str) -> str:
     """Format SQL query for display"""
-    import sqlparse
     formatted = sqlparse.format(
         sql,
         reindent=True,
@@ -1,26 +1,58 @@
 """
 Voice utilities for speech-to-text and text-to-speech
 """
-from openai import OpenAI
+import asyncio
+import hashlib
+import io
+import re
+import httpx
+from cachetools import LRUCache
+from openai import AsyncOpenAI, OpenAI
 import os
-from typing import Optional
-import tempfile
+from typing import List, Optional
 from pathlib import Path
 
+TRANSCRIPTION_MODEL = "gpt-4o-mini-transcribe"
+
+# Longer texts are spoken as sentence-aligned chunks of about this size,
+# synthesized in parallel
+TTS_CHUNK_CHARS = 200
+
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_for_speech(text: str, max_chars: int = TTS_CHUNK_CHARS) -> List[str]:
+    """Group sentences into chunks of at most max_chars (a longer sentence is its own chunk)"""
+    chunks = []
+    current = ""
+    for sentence in SENTENCE_END_RE.split(text.strip()):
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
 
 class VoiceManager:
-    """Manages voice input/output using OpenAI Whisper and TTS"""
+    """Manages voice input/output using OpenAI speech-to-text and TTS"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, http_client: Optional[httpx.Client] = None):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("OpenAI API key not found. Set OPENAI_API_KEY environment variable.")
         
-        self.client = OpenAI(api_key=self.api_key)
+        # http_client lets voice requests share the LLM's keep-alive connections
+        self.client = OpenAI(api_key=self.api_key, http_client=http_client)
+        
+        # Transcripts by audio digest, so a re-submitted recording skips the API
+        self._transcripts = LRUCache(maxsize=128)
     
     def transcribe_audio(self, audio_bytes: bytes, audio_format: str = "webm") -> str:
         """
-        Transcribe audio to text using OpenAI Whisper
+        Transcribe audio to text using OpenAI speech-to-text
         
         Args:
             audio_bytes: Audio data as bytes
@@ -29,27 +61,27 @@ class VoiceManager:
         Returns:
             Transcribed text
         """
+        key = hashlib.blake2b(audio_bytes, digest_size=16).digest()
+        cached = self._transcripts.get(key)
+        if cached is not None:
+            return cached
+        
         try:
-            # Create a temporary file to store audio
-            with tempfile.NamedTemporaryFile(suffix=f".{audio_format}", delete=False) as temp_audio:
-                temp_audio.write(audio_bytes)
-                temp_audio_path = temp_audio.name
-            
-            # Transcribe using Whisper
-            with open(temp_audio_path, "rb") as audio_file:
-                transcript = self.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language="en"
-                )
+            # The SDK takes the file type from the name of the file-like object
+            audio_file = io.BytesIO(audio_bytes)
+            audio_file.name = f"audio.{audio_format}"
             
-            # Clean up temp file
-            os.unlink(temp_audio_path)
-            
-            return transcript.text
+            transcript = self.client.audio.transcriptions.create(
+                model=TRANSCRIPTION_MODEL,
+                file=audio_file,
+                language="en"
+            )
             
         except Exception as e:
             raise Exception(f"Transcription error: {str(e)}")
+        
+        self._transcripts[key] = transcript.text
+        return transcript.text
     
     def text_to_speech(self, text: str, voice: str = "alloy") -> bytes:
         """
@@ -63,17 +95,39 @@ class VoiceManager:
             Audio data as bytes
         """
         try:
-            response = self.client.audio.speech.create(
-                model="tts-1",
-                voice=voice,
-                input=text
-            )
+            chunks = split_for_speech(text)
+            if len(chunks) <= 1:
+                response = self.client.audio.speech.create(
+                    model="tts-1",
+                    voice=voice,
+                    input=text
+                )
+                return response.content
             
-            return response.content
+            return asyncio.run(self._text_to_speech_chunks(chunks, voice))
             
         except Exception as e:
             raise Exception(f"Text-to-speech error: {str(e)}")
     
+    async def _text_to_speech_chunks(self, chunks: List[str], voice: str) -> bytes:
+        """
+        Synthesize chunks concurrently and join them in order
+        MP3 frames are self-contained, so the parts concatenate into one
+        playable stream.
+        """
+        # The async client is bound to this event loop, so it lives for one call
+        async with AsyncOpenAI(api_key=self.api_key) as async_client:
+            parts = await asyncio.gather(*(
+                async_client.audio.speech.create(
+                    model="tts-1",
+                    voice=voice,
+                    input=chunk,
+                    response_format="mp3"
+                )
+                for chunk in chunks
+            ))
+        return b"".join(part.content for part in parts)
+    
     def save_audio(self, audio_bytes: bytes, output_path: str):
         """Save audio bytes to file"""
         with open(output_path, "wb") as f: